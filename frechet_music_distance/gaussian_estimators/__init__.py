@@ -1,6 +1,7 @@
 from .shrikage_estimator import ShrinkageEstimator
 from .bootstrapping_estimator import BootstrappingEstimator
 from .gaussian_estimator import GaussianEstimator
+from .gpu_max_likelihood_estimator import GPUMaxLikelihoodEstimator
 from .leodit_wolf_estimator import LeoditWolfEstimator
 from .max_likelihood_estimator import MaxLikelihoodEstimator
 from .oas_estimator import OASEstimator
@@ -0,0 +1,28 @@
+from __future__ import annotations
+
+import numpy as np
+import torch
+from numpy.typing import NDArray
+
+from .gaussian_estimator import GaussianEstimator
+
+
+class GPUMaxLikelihoodEstimator(GaussianEstimator):
+
+    def __init__(self, device: str | torch.device | None = None) -> None:
+        super().__init__()
+        if device is None:
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        self._device = torch.device(device)
+
+    @torch.inference_mode()
+    def estimate_parameters(self, features: NDArray) -> tuple[NDArray, NDArray]:
+        # Features are uploaded as float32 and accumulated in float64 on the device, which no TF32 setting affects
+        features = torch.from_numpy(np.ascontiguousarray(features, dtype=np.float32)).to(self._device).double()
+        n = features.shape[0]
+
+        mean = features.mean(dim=0)
+        centered = features - mean
+        covariance = centered.T @ centered / (n - 1)
+
+        return mean.cpu().numpy(), covariance.cpu().numpy()
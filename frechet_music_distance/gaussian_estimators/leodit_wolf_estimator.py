@@ -1,18 +1,86 @@
+from typing import Iterable
+
+import numpy as np
+from numba import njit, prange
 from numpy.typing import NDArray
 from sklearn.covariance import LedoitWolf
 
 from .gaussian_estimator import GaussianEstimator
+from .running_moments import RunningMoments
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _ledoit_wolf_fused(features: NDArray) -> tuple[NDArray, NDArray]:
+    n_samples, n_features = features.shape
+
+    mean = np.zeros(n_features, dtype=np.float64)
+    for i in range(n_samples):
+        for j in range(n_features):
+            mean[j] += features[i, j]
+    mean /= n_samples
+
+    # Center the data and accumulate the squared row norms needed for sum(X2.T @ X2) = sum_i ||x_i||^4
+    centered = np.empty_like(features)
+    row_norms = np.empty(n_samples, dtype=np.float64)
+    for i in prange(n_samples):
+        norm = 0.0
+        for j in range(n_features):
+            value = features[i, j] - mean[j]
+            centered[i, j] = value
+            norm += value * value
+        row_norms[i] = norm
+
+    emp_cov = np.dot(centered.T, centered).astype(np.float64) / n_samples
+
+    return mean, _ledoit_wolf_shrink(emp_cov, np.sum(row_norms ** 2), n_samples)
+
+
+@njit(cache=True)
+def _ledoit_wolf_shrink(emp_cov: NDArray, norm4_sum: float, n_samples: int) -> NDArray:
+    # norm4_sum is sum_i ||x_i - mean||^4, which equals the sum of all coefficients of X2.T @ X2
+    n_features = emp_cov.shape[0]
+
+    mu = np.trace(emp_cov) / n_features
+    delta_ = np.sum(emp_cov ** 2)
+
+    beta = (norm4_sum / n_samples - delta_) / (n_features * n_samples)
+    delta = (delta_ - n_features * mu ** 2) / n_features
+    beta = min(beta, delta)
+    shrinkage = 0.0 if beta == 0 or n_features == 1 else beta / delta
+
+    covariance = (1.0 - shrinkage) * emp_cov
+    for j in range(n_features):
+        covariance[j, j] += shrinkage * mu
+
+    return covariance
 
 
 class LeoditWolfEstimator(GaussianEstimator):
 
-    def __init__(self, block_size: int = 1000) -> None:
+    def __init__(self, block_size: int = 1000, fused_threshold: int = 1_000_000) -> None:
         super().__init__()
         self._model = LedoitWolf(assume_centered=False, block_size=block_size)
+        self._fused_threshold = fused_threshold
 
     def estimate_parameters(self, features: NDArray) -> tuple[NDArray, NDArray]:
+        features = np.ascontiguousarray(features, dtype=np.float32)
+        if features.shape[1] > 1 and features.size > self._fused_threshold:
+            return _ledoit_wolf_fused(features)
+
         results = self._model.fit(features)
 
-        mean = results.location_
-        cov = results.covariance_
+        mean = results.location_.astype(np.float64)
+        cov = results.covariance_.astype(np.float64)
         return mean, cov
+
+    def estimate_parameters_streaming(self, feature_iter: Iterable[NDArray]) -> tuple[NDArray, NDArray]:
+        moments = RunningMoments(track_norms=True)
+        for features in feature_iter:
+            moments.update(features)
+
+        if moments.n == 0:
+            msg = "Ledoit-Wolf estimation requires at least 1 feature vector, feature_iter yielded none"
+            raise ValueError(msg)
+
+        emp_cov = moments.scatter / moments.n
+        return moments.mean, _ledoit_wolf_shrink(emp_cov, moments.centered_norm4_sum(), moments.n)
@@ -1,7 +1,11 @@
+from typing import Iterable
+
 import numpy as np
 from numpy.typing import NDArray
+from scipy.linalg.blas import ssyrk
 
 from .gaussian_estimator import GaussianEstimator
+from .running_moments import RunningMoments
 
 
 class MaxLikelihoodEstimator(GaussianEstimator):
@@ -10,6 +14,28 @@ class MaxLikelihoodEstimator(GaussianEstimator):
         super().__init__()
 
     def estimate_parameters(self, features: NDArray) -> tuple[NDArray, NDArray]:
-        mean = np.mean(features, axis=0)
-        covariance = np.cov(features, rowvar=False)
-        return mean, covariance
+        features = np.ascontiguousarray(features, dtype=np.float32)
+        n, n_features = features.shape
+
+        mean = features.mean(axis=0)
+        if n < 2:
+            # Same as np.cov, the unbiased covariance is undefined for fewer than two samples
+            return mean.astype(np.float64), np.full((n_features, n_features), np.nan)
+
+        centered = np.subtract(features, mean, out=np.empty_like(features))
+
+        # The transposed view is Fortran-ordered, so SYRK reads it without a copy and fills only the upper triangle
+        covariance = ssyrk(1.0 / (n - 1), centered.T, trans=0, lower=0)
+        covariance = covariance + covariance.T - np.diag(np.diag(covariance))
+        return mean.astype(np.float64), covariance.astype(np.float64)
+
+    def estimate_parameters_streaming(self, feature_iter: Iterable[NDArray]) -> tuple[NDArray, NDArray]:
+        moments = RunningMoments()
+        for features in feature_iter:
+            moments.update(features)
+
+        if moments.n < 2:
+            msg = f"MLE covariance requires at least 2 feature vectors, got {moments.n} from feature_iter"
+            raise ValueError(msg)
+
+        return moments.mean, moments.scatter / (moments.n - 1)
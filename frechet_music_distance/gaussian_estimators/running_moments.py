@@ -0,0 +1,76 @@
+from __future__ import annotations
+
+import numpy as np
+from numpy.typing import NDArray
+from scipy.linalg.blas import ssyrk
+
+
+class RunningMoments:
+    """
+    Accumulates the mean and scatter matrix of features arriving in chunks, combining chunks with Chan's
+    parallel update so that the full (n, d) feature matrix is never materialized.
+
+    Features are shifted by the mean of the first chunk to keep the accumulated sums well conditioned. With
+    track_norms enabled the sums needed for sum_i ||x_i - mean||^4 (used by Ledoit-Wolf) are collected as well.
+    """
+
+    def __init__(self, track_norms: bool = False) -> None:
+        self.n = 0
+        self._track_norms = track_norms
+        self._shift: NDArray | None = None
+        self._mean: NDArray | None = None
+        self._scatter: NDArray | None = None  # upper triangle of sum_i (x_i - mean)(x_i - mean)^T
+        self._norm2_sum = 0.0
+        self._norm4_sum = 0.0
+        self._norm2_weighted_sum: NDArray | None = None
+
+    def update(self, chunk: NDArray) -> None:
+        chunk = np.ascontiguousarray(chunk, dtype=np.float32)
+        chunk_n, n_features = chunk.shape
+        if chunk_n == 0:
+            return
+
+        if self._shift is None:
+            self._shift = chunk.mean(axis=0, dtype=np.float64)
+            self._mean = np.zeros(n_features, dtype=np.float64)
+            self._scatter = np.zeros((n_features, n_features), dtype=np.float64)
+            self._norm2_weighted_sum = np.zeros(n_features, dtype=np.float64)
+
+        shifted = chunk - self._shift.astype(np.float32)
+        chunk_mean = shifted.mean(axis=0, dtype=np.float64)
+        centered = shifted - chunk_mean.astype(np.float32)
+
+        total = self.n + chunk_n
+        delta = chunk_mean - self._mean
+        self._scatter += ssyrk(1.0, centered.T, trans=0, lower=0)
+        self._scatter += np.outer(delta, delta) * (self.n * chunk_n / total)
+        self._mean += delta * (chunk_n / total)
+        self.n = total
+
+        if self._track_norms:
+            shifted = shifted.astype(np.float64)
+            norms = np.einsum("ij,ij->i", shifted, shifted)
+            self._norm2_sum += norms.sum()
+            self._norm4_sum += norms @ norms
+            self._norm2_weighted_sum += norms @ shifted
+
+    @property
+    def mean(self) -> NDArray:
+        return self._shift + self._mean
+
+    @property
+    def scatter(self) -> NDArray:
+        upper = np.triu(self._scatter)
+        return upper + upper.T - np.diag(np.diag(upper))
+
+    def centered_norm4_sum(self) -> float:
+        # Expands sum_i ||y_i - m||^4 for the shifted features y_i and their mean m in terms of the running sums
+        mean = self._mean
+        mean_norm2 = mean @ mean
+        return (
+            self._norm4_sum
+            - 4.0 * mean @ self._norm2_weighted_sum
+            + 4.0 * mean @ self.scatter @ mean
+            + self.n * mean_norm2 ** 2
+            + 2.0 * mean_norm2 * self._norm2_sum
+        )
@@ -1,6 +1,7 @@
 from .shrikage_estimator import ShrinkageEstimator
 from .bootstrapping_estimator import BootstrappingEstimator
 from .gaussian_estimator import GaussianEstimator
+from .gpu_max_likelihood_estimator import GPUMaxLikelihoodEstimator
 from .leodit_wolf_estimator import LeoditWolfEstimator
 from .max_likelihood_estimator import MaxLikelihoodEstimator
 from .oas_estimator import OASEstimator
@@ -9,6 +10,8 @@ from .oas_estimator import OASEstimator
 def get_estimator_by_name(name: str) -> GaussianEstimator:
     if name == "mle":
         return MaxLikelihoodEstimator()
+    elif name == "mle_gpu":
+        return GPUMaxLikelihoodEstimator()
     elif name == "bootstrap":
         return BootstrappingEstimator()
     elif name == "shrinkage":
@@ -18,5 +21,5 @@ def get_estimator_by_name(name: str) -> GaussianEstimator:
     elif name == "oas":
         return OASEstimator()
     else:
-        msg = f"Unknown estimator: {name}, valid options are: mle, bootstrap, shrinkage, leodit_wolf, oas"
+        msg = f"Unknown estimator: {name}, valid options are: mle, mle_gpu, bootstrap, shrinkage, leodit_wolf, oas"
         raise ValueError(msg)
@@ -1,13 +1,18 @@
 from __future__ import annotations
 
 import logging as lg
+import re
+from functools import cached_property, partial
 from pathlib import Path
 
+import numpy as np
 import torch
 from numpy.typing import NDArray
+from tqdm import tqdm
 
 from frechet_music_distance.dataset_loaders.abc_loader import ABCLoader, DatasetLoader
 from frechet_music_distance.dataset_loaders.utils import get_dataset_ext
+from frechet_music_distance.memory import MEMORY
 from frechet_music_distance.models.feature_extractor import FeatureExtractor
 
 from .clamp_model import CLaMP
@@ -18,20 +23,41 @@ logger = lg.getLogger(__name__)
 
 class CLaMPExtractor(FeatureExtractor):
 
-    def __init__(self, verbose: bool = True) -> None:
+    # Metadata header fields and full-line comments (except %%score directives) removed by _abc_filter
+    _ABC_SKIP_LINE_RE = re.compile(r"[ABCDFGHNORrSTWwXZ]:|%(?!%score)|\n\Z")
+
+    def __init__(self, verbose: bool = True, batch_size: int = 16, compile_model: bool = True) -> None:
         super().__init__(verbose)
+        self._batch_size = batch_size
         self._clamp_model_name = "sander-wood/clamp-small-1024"
         self._device = self._get_available_device()
+        self._configure_inference(self._device)
         self._model = CLaMP.from_pretrained(self._clamp_model_name)
         self._model = self._model.to(self._device)
         self._model.eval()
+        self._use_bf16 = self._device.type == "cuda" and torch.cuda.is_bf16_supported()
+        if self._use_bf16:
+            self._model = self._model.to(dtype=torch.bfloat16)
+        if self._device.type == "cuda":
+            self._output_staging = torch.empty((batch_size, self._model.config.hidden_size), pin_memory=True)
+
+        self._compile_model = compile_model and self._device.type == "cuda"
+        if self._compile_model:
+            self._eager_music_enc = self._model.music_enc
+            self._model.music_enc = torch.compile(self._model.music_enc, mode="reduce-overhead", dynamic=False)
+            # Smallest patch bucket for which every power of two up to max_length fits within dynamo's recompile limit
+            self._min_bucket_patches = max(1, self._model.config.max_length >> (torch._dynamo.config.cache_size_limit - 1))
 
         self._patchilizer = MusicPatchilizer()
         self._softmax = torch.nn.Softmax(dim=1)
 
         self._patch_length = PATCH_LENGTH
-        self._abc_dataset_loader = ABCLoader(verbose=verbose)
+        self._encode_item = MEMORY.cache(self._encode_item, ignore=["self"])
+
 
+    @cached_property
+    def _abc_dataset_loader(self) -> ABCLoader:
+        return ABCLoader(verbose=self._verbose)
 
     @staticmethod
     def _get_available_device() -> torch.device:
@@ -43,6 +69,20 @@ class CLaMPExtractor(FeatureExtractor):
             logger.info("No GPU available, using the CPU instead.")
             return torch.device("cpu")
 
+    def _encode_item(self, item: str, music_length: int) -> NDArray:
+        """
+        Encode a single item into flattened patch ids, the result is cached on disk
+
+        Args:
+            item (str): Music data in abc format
+            music_length (int): Maximum number of patches
+
+        Returns:
+            ids (NDArray): Array of ids with a shape of (num_patches * PATCH_LENGTH,)
+        """
+        patches = self._patchilizer.encode(item, music_length=music_length, add_eos_patch=True)
+        return np.asarray(patches, dtype=np.int16).reshape(-1)
+
     def _encoding_data(self, data: list[str], music_length: int) -> list[torch.Tensor]:
         """
         Encode the data into ids
@@ -55,14 +95,12 @@ class CLaMPExtractor(FeatureExtractor):
         """
         ids_list = []
         for item in data:
-            patches = self._patchilizer.encode(item, music_length=music_length, add_eos_patch=True)
-            new_patches = torch.tensor(patches)
-            new_patches = new_patches.reshape(-1)
-            ids_list.append(new_patches)
+            ids = self._encode_item(item, music_length)
+            ids_list.append(torch.from_numpy(ids).long())
         return ids_list
 
-    @staticmethod
-    def _abc_filter(lines: list[str]) -> str:
+    @classmethod
+    def _abc_filter(cls, lines: list[str]) -> str:
         """
             Filter out the metadata from the abc file
 
@@ -72,46 +110,92 @@ class CLaMPExtractor(FeatureExtractor):
             Returns:
                 music (str): Music string
             """
-        music = ""
+        music = []
         for line in lines:
-            if line[:2] in ["A:", "B:", "C:", "D:", "F:", "G", "H:", "N:", "O:", "R:", "r:", "S:", "T:", "W:", "w:",
-                            "X:", "Z:"] \
-                    or line == "\n" \
-                    or (line.startswith("%") and not line.startswith("%%score")):
+            if cls._ABC_SKIP_LINE_RE.match(line):
                 continue
+            if "%" in line and not line.startswith("%%score"):
+                music.append(line.rpartition("%")[0][:-1] + "\n")
             else:
-                if "%" in line and not line.startswith("%%score"):
-                    line = "%".join(line.split("%")[:-1])
-                    music += line[:-1] + "\n"
-                else:
-                    music += line + '\n'
-        return music
+                music.append(line + "\n")
+        return "".join(music)
 
+    def _collate(self, ids_list: list[torch.Tensor], batch_size: int) -> tuple[torch.Tensor, torch.Tensor]:
+        """
+        Pad the ids to a common length and build the matching patch masks, when the encoder is compiled
+        the length is rounded up to a power of two number of patches and the batch is padded to batch_size
+        rows so that the encoder only ever sees a few static shapes
 
-    def _get_features(self, ids_list: list[torch.Tensor]) -> torch.Tensor:
+        Args:
+            ids_list (list): List of ids
+            batch_size (int): Number of rows a partial batch is padded to when the encoder is compiled
+
+        Returns:
+            ids (torch.Tensor): Padded ids with a shape of (num_rows, max_length)
+            masks (torch.Tensor): Patch masks with a shape of (num_rows, max_length // PATCH_LENGTH)
+        """
+        lengths = torch.tensor([ids.numel() for ids in ids_list])
+        num_patches = -(-int(lengths.max()) // PATCH_LENGTH)
+        num_rows = len(ids_list)
+        if self._compile_model:
+            num_patches = min(self._bucket_size(num_patches, self._min_bucket_patches), self._model.config.max_length)
+            num_rows = max(num_rows, batch_size)
+        max_length = num_patches * PATCH_LENGTH
+
+        # Pinned host memory lets the non-blocking copies below run asynchronously
+        pin_memory = self._device.type == "cuda"
+        ids = torch.full((num_rows, max_length), self._patchilizer.pad_id, dtype=torch.long, pin_memory=pin_memory)
+        for i, item in enumerate(ids_list):
+            ids[i, :item.numel()] = item
+
+        # Padding rows attend to a single patch so that their (discarded) pooled features stay finite
+        patch_counts = torch.ones(num_rows, dtype=torch.long)
+        patch_counts[:len(ids_list)] = lengths // PATCH_LENGTH
+        masks = torch.empty((num_rows, num_patches), dtype=torch.bool, pin_memory=pin_memory)
+        torch.gt(patch_counts[:, None], torch.arange(num_patches), out=masks)
+
+        return ids.to(self._device, non_blocking=True), masks.to(self._device, non_blocking=True)
+
+    def _encode_music(self, ids: torch.Tensor, masks: torch.Tensor) -> torch.Tensor:
+        if self._compile_model:
+            try:
+                return self._model.music_enc(ids, masks)["last_hidden_state"]
+            except Exception as e:
+                # torch.compile only fails on the first call, e.g. when no working Triton is installed
+                logger.warning(f"Compiled CLaMP music encoder failed, falling back to eager mode: {e}")
+                self._model.music_enc = self._eager_music_enc
+                self._compile_model = False
+
+        return self._model.music_enc(ids, masks)["last_hidden_state"]
+
+    def _get_features(self, ids_list: list[torch.Tensor], batch_size: int | None = None) -> torch.Tensor:
         """
         Get the features from the CLaMP _model
 
         Args:
             ids_list (list): List of ids
+            batch_size (int): Number of items passed through the _model at once, defaults to the extractor batch size
 
         Returns:
             features_list (torch.Tensor): Tensor of features with a shape of (batch_size, hidden_size)
         """
+        if batch_size is None:
+            batch_size = self._batch_size
 
         features_list = []
-        with torch.no_grad():
-            for ids in ids_list:
-                ids = ids.unsqueeze(0)
-                masks = torch.tensor([1] * (int(len(ids[0]) / PATCH_LENGTH))).unsqueeze(0)
-                features = self._model.music_enc(ids, masks)["last_hidden_state"]
+        autocast = torch.autocast(device_type=self._device.type, dtype=torch.bfloat16, enabled=self._use_bf16)
+        with torch.inference_mode(), autocast:
+            for start in range(0, len(ids_list), batch_size):
+                batch = ids_list[start:start + batch_size]
+                ids, masks = self._collate(batch, batch_size)
+                features = self._encode_music(ids, masks)
                 features = self._model.avg_pooling(features, masks)
                 features = self._model.music_proj(features)
-                features_list.append(features[0])
+                features_list.append(features[:len(batch)].float())
 
-        return torch.stack(features_list).to(self._device)
+        return torch.cat(features_list)
 
-    @torch.no_grad()
+    @torch.inference_mode()
     def _extract_feature(self, data: str) -> torch.Tensor:
         """
         Extract features from the music data
@@ -125,7 +209,24 @@ class CLaMPExtractor(FeatureExtractor):
         # self._abc_filter([data])
         ids = self._encoding_data([data], music_length=self._model.config.max_length)
         features = self._get_features(ids_list=ids)
-        return features.detach().cpu().numpy()
+        return self._to_numpy(features)
+
+    def _extract_features(self, data: list[str]) -> NDArray:
+        encode = partial(self._encode_item, music_length=self._model.config.max_length)
+        features = []
+        ids_list = []
+
+        for ids in tqdm(self._prefetch(encode, data), total=len(data), desc="Extracting features", disable=(not self._verbose)):
+            ids_list.append(torch.from_numpy(ids).long())
+            if len(ids_list) == self._batch_size:
+                features.append(self._to_numpy(self._get_features(ids_list)))
+                self._release_cached_memory(len(features) * self._batch_size, step=self._batch_size)
+                ids_list = []
+
+        if ids_list:
+            features.append(self._to_numpy(self._get_features(ids_list)))
+
+        return np.vstack(features)
 
     def _choose_dataset_loader(self, extension: str) -> DatasetLoader:
         if extension == ".abc":
@@ -138,7 +239,8 @@ class CLaMPExtractor(FeatureExtractor):
         extension = get_dataset_ext(dataset_path)
         data = self._choose_dataset_loader(extension).load_dataset_async(dataset_path)
 
-        return super()._extract_features(data)
+        unique_data, inverse = self._deduplicate(data)
+        return self._extract_features(unique_data)[inverse]
 
     def extract_feature(self, filepath: str | Path) -> NDArray:
         extension = Path(filepath).suffix
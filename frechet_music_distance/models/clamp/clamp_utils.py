@@ -212,7 +212,7 @@ class MusicEncoder(PreTrainedModel):
         input_musics = torch.nn.functional.one_hot(input_musics, num_classes=PATCH_FEATURES)
 
         # Reshape the input music patches to feed into the linear layer
-        input_musics = input_musics.reshape(len(input_musics), -1, PATCH_LENGTH*PATCH_FEATURES).type(torch.FloatTensor)
+        input_musics = input_musics.reshape(len(input_musics), -1, PATCH_LENGTH*PATCH_FEATURES).float()
 
         # Apply the linear layer to convert the one-hot encoded patches to hidden features
         input_musics = self.patch_embedding(input_musics.to(self.device))
@@ -1,14 +1,19 @@
 from __future__ import annotations
 
+import logging as lg
+from functools import cached_property
 from pathlib import Path
 
+import numpy as np
 import torch
 from accelerate import Accelerator
 from numpy.typing import NDArray
+from tqdm import tqdm
 from transformers import AutoTokenizer, BertConfig
 
 from frechet_music_distance.dataset_loaders import ABCLoader, DatasetLoader, MIDIasMTFLoader
 from frechet_music_distance.dataset_loaders.utils import get_dataset_ext
+from frechet_music_distance.memory import MEMORY
 from frechet_music_distance.models.feature_extractor import FeatureExtractor
 from frechet_music_distance.utils import download_file
 
@@ -16,15 +21,16 @@ from . import config
 from .clamp2_model import CLaMP2
 from .m3_patchilizer import M3Patchilizer
 
+logger = lg.getLogger(__name__)
+
 
 class CLaMP2Extractor(FeatureExtractor):
 
-    def __init__(self, verbose: bool = True) -> None:
+    def __init__(self, verbose: bool = True, segment_batch_size: int = 8, compile_model: bool = True) -> None:
         super().__init__(verbose)
-        self._accelerator = Accelerator()
-        self._device = self._accelerator.device
-        self._midi_dataset_loader = MIDIasMTFLoader(verbose=verbose)
-        self._abc_dataset_loader = ABCLoader(verbose=verbose)
+        self._segment_batch_size = segment_batch_size
+        self._device = self._accelerator.device if torch.cuda.is_available() else torch.device("cpu")
+        self._configure_inference(self._device)
 
         m3_config = BertConfig(
             vocab_size=1,
@@ -38,6 +44,8 @@ class CLaMP2Extractor(FeatureExtractor):
         self._model = self._model.to(self._device)
         self._tokenizer = AutoTokenizer.from_pretrained(config.TEXT_MODEL_NAME)
         self._patchilizer = M3Patchilizer()
+        self._pad_patch = torch.full((config.PATCH_LENGTH, config.PATCH_SIZE), self._patchilizer.pad_token_id, dtype=torch.long)
+        self._encode_item = MEMORY.cache(self._encode_item, ignore=["self"])
 
         self._model.eval()
 
@@ -48,16 +56,119 @@ class CLaMP2Extractor(FeatureExtractor):
             self._checkpoint = torch.load(config.CLAMP2_WEIGHTS_PATH, map_location="cpu", weights_only=True)
 
         self._model.load_state_dict(self._checkpoint["model"])
+        self._use_bf16 = self._device.type == "cuda" and torch.cuda.is_bf16_supported()
+        if self._use_bf16:
+            self._model = self._model.to(dtype=torch.bfloat16)
+
+        self._compile_model = compile_model and self._device.type == "cuda"
+        if self._compile_model:
+            self._eager_get_music_features = self._model.get_music_features
+            self._model.get_music_features = torch.compile(self._model.get_music_features, dynamic=False)
+            self._init_graph_buffers()
+        if self._device.type == "cuda":
+            self._output_staging = torch.empty((1, config.CLAMP2_HIDDEN_SIZE), pin_memory=True)
+
+    @cached_property
+    def _accelerator(self) -> Accelerator:
+        return Accelerator()
+
+    @cached_property
+    def _midi_dataset_loader(self) -> MIDIasMTFLoader:
+        return MIDIasMTFLoader(verbose=self._verbose)
+
+    @cached_property
+    def _abc_dataset_loader(self) -> ABCLoader:
+        return ABCLoader(verbose=self._verbose)
 
     def _download_checkpoint(self) -> None:
         print(f"Downloading CLaMP2 weights from: {config.CLAMP2_WEIGHTS_URL} into {config.CLAMP2_WEIGHTS_PATH}")
         download_file(config.CLAMP2_WEIGHTS_URL, config.CLAMP2_WEIGHTS_PATH, verbose=self._verbose)
 
-    @torch.no_grad()
+    def _init_graph_buffers(self) -> None:
+        # Persistent buffers for the CUDA graphs, each captured batch size uses a leading slice of them
+        self._graph_inputs = torch.empty(
+            (self._segment_batch_size, config.PATCH_LENGTH, config.PATCH_SIZE), dtype=torch.long, device=self._device
+        )
+        self._graph_masks = torch.empty(
+            (self._segment_batch_size, config.PATCH_LENGTH), dtype=torch.bool, device=self._device
+        )
+        self._cuda_graphs: dict[int, tuple[torch.cuda.CUDAGraph, torch.Tensor]] = {}
+
+    def _capture_graphs(self) -> None:
+        # All graphs share one memory pool, captured from the largest batch size down so that the smaller captures
+        # fit into the memory the largest one reserved. This is safe because the output of every replay is copied
+        # out before the next replay, whose intermediates may overwrite it.
+        pool = torch.cuda.graph_pool_handle()
+        sizes = range(1, self._segment_batch_size + 1)
+        batch_sizes = {min(self._bucket_size(size), self._segment_batch_size) for size in sizes}
+        for batch_size in sorted(batch_sizes, reverse=True):
+            self._cuda_graphs[batch_size] = self._capture_graph(batch_size, pool)
+
+    def _capture_graph(self, batch_size: int, pool: tuple[int, int]) -> tuple[torch.cuda.CUDAGraph, torch.Tensor]:
+        music_inputs = self._graph_inputs[:batch_size].fill_(self._patchilizer.pad_token_id)
+        music_masks = self._graph_masks[:batch_size].fill_(True)
+
+        # Warm up on a side stream so that compilation and lazy initialization happen outside of the capture
+        stream = torch.cuda.Stream(self._device)
+        stream.wait_stream(torch.cuda.current_stream(self._device))
+        with torch.cuda.stream(stream):
+            for _ in range(2):
+                self._model.get_music_features(music_inputs=music_inputs, music_masks=music_masks)
+        torch.cuda.current_stream(self._device).wait_stream(stream)
+
+        graph = torch.cuda.CUDAGraph()
+        with torch.cuda.graph(graph, pool=pool):
+            music_features = self._model.get_music_features(music_inputs=music_inputs, music_masks=music_masks)
+
+        return graph, music_features
+
+    def _get_music_features(self, music_inputs: torch.Tensor, music_masks: torch.Tensor) -> torch.Tensor:
+        batch_size = music_inputs.size(0)
+        # Graphs are only captured for a few batch sizes, the leading rows of the next larger one are used
+        graph_batch_size = min(self._bucket_size(batch_size), self._segment_batch_size)
+        if self._compile_model and not self._cuda_graphs:
+            try:
+                self._capture_graphs()
+            except Exception as e:
+                # torch.compile only fails on the first call, e.g. when no working Triton is installed
+                logger.warning(f"Compiled CLaMP2 music encoder failed, falling back to eager mode: {e}")
+                self._model.get_music_features = self._eager_get_music_features
+                self._compile_model = False
+
+        if not self._compile_model:
+            return self._model.get_music_features(
+                music_inputs=music_inputs.to(self._device, non_blocking=True),
+                music_masks=music_masks.to(self._device, non_blocking=True),
+            )
+
+        graph, music_features = self._cuda_graphs[graph_batch_size]
+        self._graph_inputs[:batch_size].copy_(music_inputs, non_blocking=True)
+        self._graph_masks[:batch_size].copy_(music_masks, non_blocking=True)
+        graph.replay()
+
+        return music_features[:batch_size]
+
+    def _encode_item(self, data: str) -> NDArray:
+        patches = self._patchilizer.encode(data, add_special_patches=True)
+        return np.asarray(patches, dtype=np.int16)
+
     def _extract_feature(self, data: str) -> NDArray:
+        return self._extract_encoded_feature(self._encode_item(data))
+
+    def _extract_features(self, data: list[str]) -> NDArray:
+        features = []
 
-        input_data = self._patchilizer.encode(data, add_special_patches=True)
-        input_data = torch.tensor(input_data)
+        encoded_data = self._prefetch(self._encode_item, data)
+        for input_data in tqdm(encoded_data, total=len(data), desc="Extracting features", disable=(not self._verbose)):
+            features.append(self._extract_encoded_feature(input_data))
+            self._release_cached_memory(len(features))
+
+        return np.vstack(features)
+
+    @torch.inference_mode()
+    def _extract_encoded_feature(self, input_data: NDArray) -> NDArray:
+
+        input_data = torch.from_numpy(input_data).long()
         max_input_length = config.PATCH_LENGTH
 
         segment_list = []
@@ -65,29 +176,35 @@ class CLaMP2Extractor(FeatureExtractor):
             segment_list.append(input_data[i:i+max_input_length])
         segment_list[-1] = input_data[-max_input_length:]
 
+        num_segments = len(segment_list)
+        # Pinned host memory lets the non-blocking copies to the device run asynchronously
+        pin_memory = self._device.type == "cuda"
+        segment_lengths = torch.tensor([segment.size(0) for segment in segment_list])
+        input_segments = torch.empty((num_segments, *self._pad_patch.shape), dtype=torch.long, pin_memory=pin_memory)
+        input_segments.copy_(self._pad_patch.expand(num_segments, -1, -1))
+        for input_segment, segment in zip(input_segments, segment_list):
+            input_segment[:segment.size(0)].copy_(segment)
+        input_masks = torch.empty((num_segments, max_input_length), dtype=torch.bool, pin_memory=pin_memory)
+        torch.lt(torch.arange(max_input_length), segment_lengths[:, None], out=input_masks)
+
+        # Segments go through the model in chunks, the one-hot patch embedding makes each one several tens of MB
         last_hidden_states_list = []
+        with torch.autocast(device_type=self._device.type, dtype=torch.bfloat16, enabled=self._use_bf16):
+            for start in range(0, num_segments, self._segment_batch_size):
+                last_hidden_states = self._get_music_features(
+                    music_inputs=input_segments[start:start + self._segment_batch_size],
+                    music_masks=input_masks[start:start + self._segment_batch_size],
+                )
+                # Copy out of the CUDA graph output buffer before the next replay overwrites it
+                last_hidden_states_list.append(last_hidden_states.to(torch.float, copy=True))
+        last_hidden_states_list = torch.cat(last_hidden_states_list)
 
-        for input_segment in segment_list:
-            input_masks = torch.tensor([1]*input_segment.size(0))
-            pad_indices = torch.ones((config.PATCH_LENGTH - input_segment.size(0), config.PATCH_SIZE)).long() * self._patchilizer.pad_token_id
-            input_masks = torch.cat((input_masks, torch.zeros(max_input_length - input_segment.size(0))), 0)
-            input_segment = torch.cat((input_segment, pad_indices), 0)
-            last_hidden_states = self._model.get_music_features(music_inputs=input_segment.unsqueeze(0).to(self._device),
-                                                               music_masks=input_masks.unsqueeze(0).to(self._device))
-            last_hidden_states_list.append(last_hidden_states)
-
-        full_chunk_cnt = len(input_data) // max_input_length
-        remain_chunk_len = len(input_data) % max_input_length
-        if remain_chunk_len == 0:
-            feature_weights = torch.tensor([max_input_length] * full_chunk_cnt, device=self._device).view(-1, 1)
-        else:
-            feature_weights = torch.tensor([max_input_length] * full_chunk_cnt + [remain_chunk_len], device=self._device).view(-1, 1)
+        feature_weights = torch.full((num_segments,), max_input_length, dtype=torch.float, device=self._device)
+        feature_weights[-1] = len(input_data) - (num_segments - 1) * max_input_length
 
-        last_hidden_states_list = torch.concat(last_hidden_states_list, 0)
-        last_hidden_states_list = last_hidden_states_list * feature_weights
-        last_hidden_states_list = last_hidden_states_list.sum(dim=0) / feature_weights.sum()
+        features = torch.einsum("bd,b->d", last_hidden_states_list, feature_weights) / feature_weights.sum()
 
-        return last_hidden_states_list.unsqueeze(0).detach().cpu().numpy()
+        return self._to_numpy(features.unsqueeze(0))
 
     def _choose_dataset_loader(self, extension: str) -> DatasetLoader:
         if extension in (".mid", ".midi"):
@@ -102,7 +219,8 @@ class CLaMP2Extractor(FeatureExtractor):
         extension = get_dataset_ext(dataset_path)
         data = self._choose_dataset_loader(extension).load_dataset_async(dataset_path)
 
-        return super()._extract_features(data)
+        unique_data, inverse = self._deduplicate(data)
+        return self._extract_features(unique_data)[inverse]
 
     def extract_feature(self, filepath: str | Path) -> NDArray:
         extension = Path(filepath).suffix
@@ -24,7 +24,7 @@ class M3PatchEncoder(PreTrainedModel):
 
         # Transform input_patches into embeddings
         input_patches = torch.nn.functional.one_hot(input_patches, num_classes=128)
-        input_patches = input_patches.reshape(len(input_patches), -1, PATCH_SIZE*128).type(torch.FloatTensor)
+        input_patches = input_patches.reshape(len(input_patches), -1, PATCH_SIZE*128).float()
         input_patches = self.patch_embedding(input_patches.to(self.device))
 
         # Apply BERT model to input_patches and input_masks
@@ -1,21 +1,90 @@
 from __future__ import annotations
 
+import hashlib
+import os
 from abc import ABC, abstractmethod
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Iterable
+from typing import Any, Callable, Iterable, Iterator
 
 from ..memory import MEMORY
 import numpy as np
+import torch
 from numpy.typing import NDArray
 from tqdm import tqdm
 
+# Pieces differ in length, so extraction allocates many differently sized tensors. Expandable segments keep the
+# caching allocator from fragmenting over long runs, this only takes effect if set before CUDA is initialized
+os.environ.setdefault("PYTORCH_CUDA_ALLOC_CONF", "expandable_segments:True,garbage_collection_threshold:0.8")
+
 
 class FeatureExtractor(ABC):
 
+    _EMPTY_CACHE_INTERVAL = 256
+
     def __init__(self, verbose: bool = True) -> None:
         self._verbose = verbose
+        self._output_staging: torch.Tensor | None = None
         self.extract_features = MEMORY.cache(self.extract_features, ignore=["self"])
 
+    @staticmethod
+    def _configure_inference(device: torch.device) -> None:
+        torch.backends.cudnn.benchmark = True
+        if device.type == "cpu":
+            torch.set_num_threads(os.cpu_count())
+
+    @staticmethod
+    def _bucket_size(size: int, min_size: int = 1) -> int:
+        # Round up to a power of two so that compiled models only ever see a handful of input shapes
+        return max(min_size, 1 << (size - 1).bit_length())
+
+    def _to_numpy(self, features: torch.Tensor) -> NDArray:
+        # Reuse the pinned staging buffer allocated by the subclass instead of a fresh host allocation per call
+        if self._output_staging is None or features.size(0) > self._output_staging.size(0):
+            return features.detach().cpu().numpy()
+
+        staging = self._output_staging[:features.size(0)]
+        staging.copy_(features.detach())
+        return staging.numpy().copy()
+
+    @classmethod
+    def _release_cached_memory(cls, num_processed: int, step: int = 1) -> None:
+        # Hand unused cached blocks back to the driver each time another _EMPTY_CACHE_INTERVAL items are done
+        interval = cls._EMPTY_CACHE_INTERVAL
+        if torch.cuda.is_initialized() and num_processed // interval > (num_processed - step) // interval:
+            torch.cuda.empty_cache()
+
+    @staticmethod
+    def _prefetch(func: Callable[[Any], Any], data: Iterable[Any], max_workers: int | None = None) -> Iterator[Any]:
+        # Run the CPU preprocessing in worker threads while the caller consumes results (in order) on the model
+        max_workers = max_workers or os.cpu_count()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending: deque[Future] = deque()
+            for item in data:
+                pending.append(executor.submit(func, item))
+                if len(pending) >= 2 * max_workers:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    @staticmethod
+    def _deduplicate(data: list[str]) -> tuple[list[str], NDArray]:
+        # Identical inputs are extracted once, features[inverse] scatters the results back to every occurrence
+        with ThreadPoolExecutor() as executor:
+            digests = executor.map(lambda item: hashlib.blake2b(item.encode(), digest_size=16).digest(), data)
+
+        first_index: dict[bytes, int] = {}
+        unique_data = []
+        inverse = np.empty(len(data), dtype=np.intp)
+        for i, digest in enumerate(digests):
+            if digest not in first_index:
+                first_index[digest] = len(unique_data)
+                unique_data.append(data[i])
+            inverse[i] = first_index[digest]
+
+        return unique_data, inverse
+
     @abstractmethod
     def _extract_feature(self, data: Any) -> NDArray:
         pass
@@ -0,0 +1,131 @@
+import copy
+
+import numpy as np
+import pytest
+import torch
+from transformers import BertConfig
+
+from frechet_music_distance.models import CLaMP2Extractor
+from frechet_music_distance.models.clamp2 import config
+from frechet_music_distance.models.clamp2.clamp2_model import CLaMP2
+from frechet_music_distance.models.clamp2.m3_patch_encoder import M3PatchEncoder
+from frechet_music_distance.models.clamp2.m3_patchilizer import M3Patchilizer
+
+
+class _TinyCLaMP2(torch.nn.Module):
+    avg_pooling = CLaMP2.avg_pooling
+    get_music_features = CLaMP2.get_music_features
+
+    def __init__(self) -> None:
+        super().__init__()
+        m3_config = BertConfig(
+            vocab_size=1,
+            hidden_size=config.M3_HIDDEN_SIZE,
+            num_hidden_layers=1,
+            num_attention_heads=2,
+            intermediate_size=64,
+            max_position_embeddings=config.PATCH_LENGTH,
+        )
+        self.music_model = M3PatchEncoder(m3_config)
+        self.music_proj = torch.nn.Linear(config.M3_HIDDEN_SIZE, config.CLAMP2_HIDDEN_SIZE)
+        self.device = torch.device("cpu")
+
+
+@pytest.fixture(scope="module", name="tiny_model")
+def fixture_tiny_model() -> _TinyCLaMP2:
+    torch.manual_seed(0)
+    return _TinyCLaMP2().eval()
+
+
+def _make_extractor(model: _TinyCLaMP2, segment_batch_size: int) -> CLaMP2Extractor:
+    # Bypasses __init__, which would download the text model and the CLaMP2 weights
+    extractor = object.__new__(CLaMP2Extractor)
+    extractor._verbose = False
+    extractor._device = torch.device("cpu")
+    extractor._model = model
+    extractor._patchilizer = M3Patchilizer()
+    extractor._pad_patch = torch.full(
+        (config.PATCH_LENGTH, config.PATCH_SIZE), extractor._patchilizer.pad_token_id, dtype=torch.long
+    )
+    extractor._segment_batch_size = segment_batch_size
+    extractor._compile_model = False
+    extractor._use_bf16 = False
+    extractor._output_staging = None
+    return extractor
+
+
+@torch.no_grad()
+def _per_segment_feature(model: _TinyCLaMP2, input_data: np.ndarray) -> np.ndarray:
+    # Segment by segment reference, as the extractor computed it before segments were batched
+    input_data = torch.from_numpy(input_data).long()
+    segment_list = [input_data[i:i + config.PATCH_LENGTH] for i in range(0, len(input_data), config.PATCH_LENGTH)]
+    segment_list[-1] = input_data[-config.PATCH_LENGTH:]
+
+    last_hidden_states_list = []
+    for segment in segment_list:
+        pad_length = config.PATCH_LENGTH - segment.size(0)
+        input_masks = torch.cat((torch.ones(segment.size(0)), torch.zeros(pad_length)))
+        input_segment = torch.cat((segment, torch.zeros((pad_length, config.PATCH_SIZE), dtype=torch.long)))
+        last_hidden_states_list.append(model.get_music_features(input_segment.unsqueeze(0), input_masks.unsqueeze(0)))
+
+    remainder = len(input_data) % config.PATCH_LENGTH
+    feature_weights = [config.PATCH_LENGTH] * (len(input_data) // config.PATCH_LENGTH) + ([remainder] if remainder else [])
+    feature_weights = torch.tensor(feature_weights, dtype=torch.float).view(-1, 1)
+    features = (torch.cat(last_hidden_states_list) * feature_weights).sum(dim=0) / feature_weights.sum()
+    return features.unsqueeze(0).numpy()
+
+
+class TestCLaMP2Extractor:
+    @staticmethod
+    @pytest.mark.parametrize("num_patches", [100, config.PATCH_LENGTH, 2 * config.PATCH_LENGTH + 100])
+    @pytest.mark.parametrize("segment_batch_size", [1, 2])
+    def test_batched_segments_match_per_segment_loop(tiny_model, num_patches, segment_batch_size):
+        rng = np.random.default_rng(num_patches)
+        input_data = rng.integers(0, 128, size=(num_patches, config.PATCH_SIZE), dtype=np.int16)
+        extractor = _make_extractor(tiny_model, segment_batch_size)
+
+        features = extractor._extract_encoded_feature(input_data)
+        assert features == pytest.approx(_per_segment_feature(tiny_model, input_data), abs=1e-5)
+
+    @staticmethod
+    def test_falls_back_to_eager_when_compilation_fails(tiny_model, monkeypatch):
+        input_data = np.random.default_rng(0).integers(0, 128, size=(600, config.PATCH_SIZE), dtype=np.int16)
+        reference = _make_extractor(tiny_model, segment_batch_size=2)._extract_encoded_feature(input_data)
+
+        def failing_capture():
+            raise RuntimeError("Cannot find a working triton installation")
+
+        extractor = _make_extractor(tiny_model, segment_batch_size=2)
+        extractor._compile_model = True
+        extractor._cuda_graphs = {}
+        extractor._eager_get_music_features = tiny_model.get_music_features
+        monkeypatch.setattr(extractor, "_capture_graphs", failing_capture)
+
+        features = extractor._extract_encoded_feature(input_data)
+        assert extractor._compile_model is False
+        assert features == pytest.approx(reference, abs=1e-6)
+
+    @staticmethod
+    @pytest.mark.skipif(not torch.cuda.is_available(), reason="CUDA graphs require a GPU")
+    def test_cuda_graphs_match_eager(tiny_model):
+        model = copy.deepcopy(tiny_model).cuda()
+        model.device = torch.device("cuda")
+        # Six segments with chunks of four replay the graphs captured for four and two segments
+        num_patches = 5 * config.PATCH_LENGTH + 100
+        input_data = np.random.default_rng(0).integers(0, 128, size=(num_patches, config.PATCH_SIZE), dtype=np.int16)
+
+        eager = _make_extractor(model, segment_batch_size=4)
+        eager._device = model.device
+        reference = eager._extract_encoded_feature(input_data)
+
+        extractor = _make_extractor(model, segment_batch_size=4)
+        extractor._device = model.device
+        extractor._compile_model = True
+        extractor._eager_get_music_features = model.get_music_features
+        extractor._init_graph_buffers()
+
+        for _ in range(2):
+            features = extractor._extract_encoded_feature(input_data)
+            assert features == pytest.approx(reference, abs=1e-4)
+        assert extractor._compile_model is True
+        assert sorted(extractor._cuda_graphs) == [1, 2, 4]
@@ -0,0 +1,101 @@
+import pytest
+import torch
+from transformers import BertConfig
+
+from frechet_music_distance.models import CLaMPExtractor
+from frechet_music_distance.models.clamp.clamp_model import CLaMP
+from frechet_music_distance.models.clamp.clamp_utils import PATCH_FEATURES, PATCH_LENGTH, MusicEncoder, MusicPatchilizer
+
+
+class _TinyCLaMP(torch.nn.Module):
+    avg_pooling = CLaMP.avg_pooling
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.config = BertConfig(
+            hidden_size=32, num_hidden_layers=1, num_attention_heads=2, intermediate_size=64, max_position_embeddings=16
+        )
+        self.config.max_length = 16
+        self.music_enc = MusicEncoder(self.config)
+        self.music_proj = torch.nn.Linear(32, 32)
+        self.device = torch.device("cpu")
+
+
+def _make_extractor(model: _TinyCLaMP, batch_size: int, compile_model: bool) -> CLaMPExtractor:
+    # Bypasses __init__, which would download the CLaMP weights
+    extractor = object.__new__(CLaMPExtractor)
+    extractor._verbose = False
+    extractor._device = torch.device("cpu")
+    extractor._model = model
+    extractor._patchilizer = MusicPatchilizer()
+    extractor._batch_size = batch_size
+    # Without CUDA nothing is compiled, but the padding to static shapes still runs through the eager model
+    extractor._compile_model = compile_model
+    extractor._use_bf16 = False
+    extractor._min_bucket_patches = 1
+    extractor._output_staging = None
+    return extractor
+
+
+class TestCLaMPExtractor:
+    @staticmethod
+    def test_falls_back_to_eager_when_compilation_fails():
+        torch.manual_seed(0)
+        model = _TinyCLaMP().eval()
+        ids_list = [torch.randint(0, PATCH_FEATURES, (num_patches * PATCH_LENGTH,)) for num_patches in [2, 3]]
+        reference = _make_extractor(model, batch_size=2, compile_model=False)._get_features(ids_list)
+
+        class FailingMusicEncoder(torch.nn.Module):
+            def forward(self, ids, masks):
+                raise RuntimeError("Cannot find a working triton installation")
+
+        extractor = _make_extractor(model, batch_size=2, compile_model=True)
+        extractor._eager_music_enc = model.music_enc
+        model.music_enc = FailingMusicEncoder()
+        try:
+            features = extractor._get_features(ids_list)
+        finally:
+            model.music_enc = extractor._eager_music_enc
+
+        assert extractor._compile_model is False
+        assert torch.allclose(features, reference, atol=1e-5)
+
+    @staticmethod
+    @pytest.mark.parametrize("compile_model", [False, True])
+    def test_batched_features_match_per_item_loop(compile_model):
+        torch.manual_seed(0)
+        model = _TinyCLaMP().eval()
+        ids_list = [torch.randint(0, PATCH_FEATURES, (num_patches * PATCH_LENGTH,)) for num_patches in [1, 5, 3, 16, 2]]
+        extractor = _make_extractor(model, batch_size=3, compile_model=compile_model)
+
+        with torch.no_grad():
+            reference = []
+            for ids in ids_list:
+                masks = torch.ones((1, ids.numel() // PATCH_LENGTH))
+                features = model.music_enc(ids.unsqueeze(0), masks)["last_hidden_state"]
+                reference.append(model.music_proj(model.avg_pooling(features, masks)))
+            reference = torch.cat(reference)
+
+        features = extractor._get_features(ids_list)
+        assert features.shape == reference.shape
+        assert torch.allclose(features, reference, atol=1e-5)
+
+    @staticmethod
+    def test_abc_filter():
+        lines = [
+            "X:1",
+            "T:Title",
+            "G:Group",
+            "M:4/4",
+            "K:C",
+            "%%score 1 2",
+            "% full line comment",
+            "abc de % inline comment",
+            "ab %c %d",
+            "\n",
+            "",
+            "G",
+            "V:1",
+        ]
+        expected = "M:4/4\nK:C\n%%score 1 2\nabc de\nab %c\n\nG\nV:1\n"
+        assert CLaMPExtractor._abc_filter(lines) == expected
@@ -0,0 +1,10 @@
+from frechet_music_distance.models import FeatureExtractor
+
+
+class TestFeatureExtractor:
+    @staticmethod
+    def test_deduplicate():
+        data = ["a", "b", "a", "c", "b", "a"]
+        unique_data, inverse = FeatureExtractor._deduplicate(data)
+        assert unique_data == ["a", "b", "c"]
+        assert [unique_data[i] for i in inverse] == data
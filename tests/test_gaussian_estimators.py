@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+from sklearn.covariance import LedoitWolf
+
+from frechet_music_distance.gaussian_estimators import GPUMaxLikelihoodEstimator, LeoditWolfEstimator, MaxLikelihoodEstimator
+from frechet_music_distance.gaussian_estimators.leodit_wolf_estimator import _ledoit_wolf_fused
+from frechet_music_distance.utils import clear_cache
+
+
+@pytest.fixture(scope="module", name="features")
+def fixture_features() -> np.ndarray:
+    rng = np.random.default_rng(0)
+    return (rng.standard_normal((400, 32)) @ rng.standard_normal((32, 32)) + 1).astype(np.float32)
+
+
+class TestGaussianEstimators:
+    @staticmethod
+    def test_leodit_wolf_fused_matches_sklearn(features):
+        # Calls the kernel directly, the cached estimate_parameters ignores fused_threshold in its cache key
+        mean, cov = _ledoit_wolf_fused(features)
+        reference = LedoitWolf().fit(features)
+        assert mean == pytest.approx(reference.location_, abs=1e-4)
+        assert cov == pytest.approx(reference.covariance_, rel=1e-4, abs=1e-4)
+
+    @staticmethod
+    def test_mle_matches_numpy(features):
+        estimator = MaxLikelihoodEstimator()
+        mean, cov = estimator.estimate_parameters(features)
+        assert mean.dtype == cov.dtype == np.float64
+        assert mean == pytest.approx(features.mean(axis=0), abs=1e-4)
+        assert cov == pytest.approx(np.cov(features, rowvar=False), rel=1e-4, abs=1e-4)
+
+    @staticmethod
+    def test_mle_single_sample_covariance_is_nan(features):
+        estimator = MaxLikelihoodEstimator()
+        mean, cov = estimator.estimate_parameters(features[:1])
+        assert mean == pytest.approx(features[0], abs=1e-6)
+        assert cov.shape == (features.shape[1], features.shape[1])
+        assert np.isnan(cov).all()
+
+    @staticmethod
+    def test_leodit_wolf_returns_float64(features):
+        estimator = LeoditWolfEstimator()
+        mean, cov = estimator.estimate_parameters(features)
+        assert mean.dtype == cov.dtype == np.float64
+        clear_cache()
+
+    @staticmethod
+    def test_mle_streaming_matches_batch(features):
+        estimator = MaxLikelihoodEstimator()
+        mean, cov = estimator.estimate_parameters_streaming(np.array_split(features, 7))
+        assert mean == pytest.approx(features.mean(axis=0), abs=1e-4)
+        assert cov == pytest.approx(np.cov(features, rowvar=False), rel=1e-4, abs=1e-4)
+
+    @staticmethod
+    def test_leodit_wolf_streaming_matches_sklearn(features):
+        estimator = LeoditWolfEstimator()
+        mean, cov = estimator.estimate_parameters_streaming(np.array_split(features, 7))
+        reference = LedoitWolf().fit(features)
+        assert mean == pytest.approx(reference.location_, abs=1e-4)
+        assert cov == pytest.approx(reference.covariance_, rel=1e-4, abs=1e-4)
+
+    @staticmethod
+    @pytest.mark.parametrize("estimator", [MaxLikelihoodEstimator(), LeoditWolfEstimator()])
+    def test_streaming_rejects_empty_input(estimator, features):
+        with pytest.raises(ValueError):
+            estimator.estimate_parameters_streaming([])
+        with pytest.raises(ValueError):
+            estimator.estimate_parameters_streaming([features[:0], features[:0]])
+
+    @staticmethod
+    def test_mle_streaming_rejects_single_sample(features):
+        with pytest.raises(ValueError):
+            MaxLikelihoodEstimator().estimate_parameters_streaming([features[:1]])
+
+    @staticmethod
+    def test_gpu_mle_matches_numpy(features):
+        estimator = GPUMaxLikelihoodEstimator()
+        mean, cov = estimator.estimate_parameters(features)
+        assert mean.dtype == cov.dtype == np.float64
+        assert mean == pytest.approx(features.mean(axis=0), abs=1e-6)
+        assert cov == pytest.approx(np.cov(features, rowvar=False), rel=1e-6, abs=1e-6)
+        clear_cache()